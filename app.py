@@ -17,18 +17,16 @@ Prerequisites: `streamlit`, `openai`, `mcp`, and a running `mcp_server.py` that
 
 from __future__ import annotations
 
-import atexit, asyncio, json, os, re, subprocess
+import atexit, asyncio, functools, json, os, re, threading
 from collections.abc import Iterable
-from datetime import datetime, date
+from contextlib import AsyncExitStack
+from datetime import date
 from typing import Any, Dict
-import pandas as pd
 
-import numpy as np  # noqa: F401 – MCP may return numpy scalars
 import streamlit as st
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from openai import OpenAI
-import os
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -39,30 +37,180 @@ if not OPENAI_API_KEY:
     st.stop()
 
 client = OpenAI(api_key=OPENAI_API_KEY)
-SERVER_CMD = ["python", "mcp_server.py"]
-proc = subprocess.Popen(SERVER_CMD, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-atexit.register(lambda: proc.poll() is None and proc.terminate())
+SERVER_PARAMS = StdioServerParameters(
+    command="python",
+    args=["mcp_server.py"],
+    # keep the child's boot output from block-buffering before it rewraps
+    # its own stdio with 64 KiB buffers (see mcp_server._widen_stdio)
+    env={**os.environ, "PYTHONUNBUFFERED": "1"},
+)
+# Local dev: call the tool functions in-process instead of over stdio
+MCP_INPROCESS = os.getenv("EHR_MCP_INPROCESS") == "1"
+
+# Kept byte-identical across calls and placed first in `messages` so
+# OpenAI's automatic prompt-prefix cache can reuse it; everything
+# per-patient (PATIENT_CONTEXT, question) comes strictly after.
+SYSTEM_PROMPT = """\
+You are a clinical assistant supporting a doctor during a consultation. Your role is to provide medically accurate, evidence-backed suggestions strictly based on the PATIENT_CONTEXT provided.
+
+Your responsibilities include:
+
+Interpreting the patient's demographic data, vitals, medication, and medical history.
+
+Identifying important clinical findings the doctor should consider.
+
+Suggesting relevant follow-up questions the doctor might ask the patient to clarify symptoms or uncover hidden risk factors.
+
+Recommending appropriate investigations or diagnostic tests, based on the current clinical picture.
+
+Offering evidence-backed differential diagnoses, and helping the doctor rule in/out possibilities based on data.
+
+Providing treatment options or next clinical steps, referencing current standards of care where applicable.
+
+Important constraints:
+
+Only use information contained in PATIENT_CONTEXT.
+
+If the data is insufficient to draw conclusions, clearly state so.
+
+Do not guess. Do not invent symptoms or conditions not explicitly supported by the data.
+
+Present suggestions clearly and concisely, grouping them by category (e.g., questions to ask the patient, investigations, possible diagnoses, treatment options).
+
+Always prioritize clinical safety and relevance."""
+
+# ───────────── MCP host (one session per Streamlit session) ──────────────
+
+
+class MCPHost:
+    """Owns a single stdio MCP session so tool calls skip the per-call
+    spawn + handshake (`stdio_client` launches `mcp_server.py` itself)."""
+
+    def __init__(self):
+        self._stack = AsyncExitStack()
+        self.session: ClientSession | None = None
+
+    async def connect(self):
+        read, write = await self._stack.enter_async_context(
+            stdio_client(SERVER_PARAMS)
+        )
+        self.session = await self._stack.enter_async_context(
+            ClientSession(read, write)
+        )
+        await self.session.initialize()
+
+    async def aclose(self):
+        await self._stack.aclose()
+
+
+class LocalHost:
+    """Calls the @mcp.tool functions of mcp_server.py in the app process
+    (EHR_MCP_INPROCESS=1), skipping subprocess spawn, stdio buffering and
+    JSON-RPC framing — the dominant cost of stdio MCP on one machine.
+    Mirrors MCPHost's interface so call sites don't care which is active."""
+
+    def __init__(self):
+        import mcp_server
+        from types import SimpleNamespace
+
+        self._conn = mcp_server.connect_db()
+        self._ctx = SimpleNamespace(
+            request_context=SimpleNamespace(lifespan_context=self._conn)
+        )
+        self._tools = {
+            "list_patients": mcp_server.list_patients,
+            "get_patient_info": mcp_server.get_patient_info,
+            "get_vitals": mcp_server.get_vitals,
+            "get_medications": mcp_server.get_medications,
+            "get_history": mcp_server.get_history,
+            "get_patient_bundle": mcp_server.get_patient_bundle,
+        }
+
+    @property
+    def session(self):
+        return self
+
+    async def connect(self):
+        pass  # nothing to spawn
+
+    async def call_tool(self, tool: str, args: Dict[str, Any]):
+        # The stdio tools don't declare `password` either; strip it here
+        args = {k: v for k, v in args.items() if k != "password"}
+        return self._tools[tool](ctx=self._ctx, **args)
+
+    async def aclose(self):
+        self._conn.close()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """One long-lived event loop in a daemon thread; Streamlit reruns the
+    script top-to-bottom per widget change, so building a loop per call
+    (as asyncio.run does) is pure overhead."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+def _run(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_mcp() -> MCPHost | LocalHost:
+    """One connected host shared across reruns (and sessions) — widget
+    changes rerun the whole script, so without the resource cache every
+    keystroke would respawn the server and redo the handshake."""
+    host = LocalHost() if MCP_INPROCESS else MCPHost()
+    _run(host.connect())
+    atexit.register(lambda: _run(host.aclose()))
+    return host
+
 
 # ───────────── Helpers ───────────────────────────────────────────────────
 
+try:  # orjson is optional; 2–5× faster and sorts keys natively
+    import orjson
+
+    def _json_loads(s):
+        return orjson.loads(s)
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS).decode()
+
+except ImportError:
+
+    def _json_loads(s):
+        return json.loads(s)
+
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+
+
+# cold path only: repr-scraping unknown result shapes
+_FALLBACK_RE = re.compile(r"text='(.*?)'", re.S)
+
 
 def _unwrap(raw: Any, *, parse_json: bool = False):
-    if hasattr(raw, "content") and raw.content:
-        payloads = [getattr(t, "text", str(t)).strip() for t in raw.content]
+    # MCP results always carry .content in practice — check it first and
+    # defer stripping (a full copy per payload) to the parse_json branch.
+    content = getattr(raw, "content", None)
+    if content:
+        payloads = [t.text if hasattr(t, "text") else str(t) for t in content]
     elif isinstance(raw, Iterable) and not isinstance(raw, (str, bytes)):
-        payloads = [getattr(t, "text", str(t)).strip() for t in raw]
+        payloads = [getattr(t, "text", str(t)) for t in raw]
     else:
-        payloads = re.findall(r"text='(.*?)'", str(raw), flags=re.S)
-        payloads = [p.strip() for p in payloads]
+        payloads = _FALLBACK_RE.findall(str(raw))
 
     if parse_json:
-        out: List[str | dict] = []
+        out: list[str | dict] = []
         for ch in payloads:
-            if ch.lstrip().startswith("{") and ch.rstrip().endswith("}"):
+            ch = ch.strip()
+            if ch[:1] == "{" and ch[-1:] == "}":
                 try:
-                    out.append(json.loads(ch))
+                    out.append(_json_loads(ch))
                     continue
-                except json.JSONDecodeError:
+                except ValueError:
                     pass
             out.append(ch)
         return out
@@ -70,21 +218,15 @@ def _unwrap(raw: Any, *, parse_json: bool = False):
 
 
 def _call_tool(tool: str, **kwargs):
-    async def _inner():
-        async with stdio_client(
-            StdioServerParameters(command="python", args=["mcp_server.py"])
-        ) as (r, w):
-            async with ClientSession(r, w) as sess:
-                await sess.initialize()
-                return await sess.call_tool(tool, kwargs)
+    host = _get_mcp()
+    return _run(host.session.call_tool(tool, kwargs))
 
-    return asyncio.run(_inner())
 
-
-def safe_call(tool: str, *, password: str, parse_json: bool = False, **kwargs):
-    kwargs.setdefault("password", password)
-    raw = _call_tool(tool, **kwargs)
-    data = _unwrap(raw, parse_json=parse_json)
+def _postprocess(raw: Any, *, parse_json: bool = False):
+    if isinstance(raw, (dict, list)):
+        data = raw  # in-process tools already return Python objects
+    else:
+        data = _unwrap(raw, parse_json=parse_json)
 
     if isinstance(data, list) and len(data) == 1:
         data = data[0]
@@ -97,15 +239,35 @@ def safe_call(tool: str, *, password: str, parse_json: bool = False, **kwargs):
     return data
 
 
+def safe_call(tool: str, *, password: str, parse_json: bool = False, **kwargs):
+    kwargs.setdefault("password", password)
+    raw = _call_tool(tool, **kwargs)
+    return _postprocess(raw, parse_json=parse_json)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _list_patients(password: str):
+    return safe_call("list_patients", password=password)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _load_patient(pid: str, password: str):
+    """Memoized (info, vitals, meds, hx) per patient so Streamlit reruns
+    (typing, button clicks) don't re-hit the MCP layer. A single
+    get_patient_bundle RPC returns all four slices in one round-trip."""
+    bundle = safe_call(
+        "get_patient_bundle", password=password, patient_id=pid, parse_json=True
+    )
+    return bundle["info"], bundle["vitals"], bundle["meds"], bundle["history"]
+
+
 # ───────────── PII scrubbers ─────────────────────────────────────────────
 
 
-def _age(dob: str | None) -> int | None:
-    if not dob:
-        return None
+@functools.lru_cache(maxsize=1024)
+def _age_on(dob: str, today: date) -> int | None:
     try:
-        birth = datetime.strptime(dob, "%Y-%m-%d").date()
-        today = date.today()
+        birth = date.fromisoformat(dob)
         return (
             today.year
             - birth.year
@@ -115,6 +277,11 @@ def _age(dob: str | None) -> int | None:
         return None
 
 
+def _age(dob: str | None) -> int | None:
+    # keyed on (dob, today) so cached ages roll over at midnight
+    return _age_on(dob, date.today()) if dob else None
+
+
 def sanitized_info(full: Dict[str, Any]):
     return {
         k: v
@@ -123,30 +290,77 @@ def sanitized_info(full: Dict[str, Any]):
     }
 
 
+# keyword → context slice, matched in one compiled-regex pass over the query
+_KW = {
+    "age": "info",
+    "sex": "info",
+    "demograph": "info",
+    "vital": "vitals",
+    "bp": "vitals",
+    "heart": "vitals",
+    "temp": "vitals",
+    "weight": "vitals",
+    "med": "medications",
+    "drug": "medications",
+    "prescrip": "medications",
+    "history": "history",
+    "surgery": "history",
+    "smok": "history",
+}
+_KW_RE = re.compile("|".join(map(re.escape, _KW)))
+
+# bookkeeping fields the model doesn't need; every key/value costs tokens
+_CTX_DROP = frozenset({"recorded"})
+
+
+def _slim(rows):
+    if isinstance(rows, list):
+        return [
+            {k: v for k, v in r.items() if k not in _CTX_DROP and v not in (None, "")}
+            if isinstance(r, dict)
+            else r
+            for r in rows
+        ]
+    return rows
+
+
 def build_ctx(query: str, *, info, vitals, meds, hx):
-    q = query.lower()
-    ctx: Dict[str, Any] = {}
-    if any(w in q for w in ("age", "sex", "demograph")):
-        ctx["info"] = info
-    if any(w in q for w in ("vital", "bp", "heart", "temp", "weight")):
-        ctx["vitals"] = vitals
-    if any(w in q for w in ("med", "drug", "prescrip")):
-        ctx["medications"] = meds
-    if any(w in q for w in ("history", "surgery", "smok")):
-        ctx["history"] = hx
+    slices = {_KW[m.group(0)] for m in _KW_RE.finditer(query.lower())}
+    data = {"info": info, "vitals": vitals, "medications": meds, "history": hx}
+    ctx: Dict[str, Any] = {k: _slim(v) for k, v in data.items() if k in slices and v}
     if not ctx:
         ctx["info"] = info
     return ctx
 
 
+@st.cache_resource(show_spinner=False)
+def _answer_cache() -> dict:
+    """(pid, ctx_json, question) → assembled answer text. A plain dict
+    (rather than st.cache_data) so streamed replies can be stored after
+    st.write_stream has collected them."""
+    return {}
+
+
+def _stream_answer(ctx_json: str, question: str):
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": f"PATIENT_CONTEXT = {ctx_json}"},
+        {"role": "user", "content": question},
+    ]
+    stream = client.chat.completions.create(
+        model="gpt-4o", messages=messages, temperature=0.6, stream=True
+    )
+    for event in stream:
+        yield event.choices[0].delta.content or ""
+
+
 def show_table(obj: Any):
+    # Streamlit renders dicts and lists of dicts natively — no need to
+    # round-trip through a DataFrame (and pay the pandas import) for it.
     if isinstance(obj, dict):
-        st.table(pd.DataFrame([obj]))
-    elif isinstance(obj, list):
-        try:
-            st.table(pd.DataFrame(obj))
-        except ValueError:  # list of primitives
-            st.write(obj)
+        st.json(obj)
+    elif isinstance(obj, list) and obj and all(isinstance(r, dict) for r in obj):
+        st.dataframe(obj, use_container_width=True)
     else:
         st.write(obj)
 
@@ -163,7 +377,7 @@ if not password:
     st.stop()
 
 try:
-    patients = safe_call("list_patients", password=password)
+    patients = _list_patients(password)
 except RuntimeError as e:
     st.error(e)
     st.stop()
@@ -172,15 +386,12 @@ pid = st.sidebar.selectbox("Select patient", patients)
 if not pid:
     st.stop()
 
+if st.sidebar.button("Refresh"):
+    _list_patients.clear()
+    _load_patient.clear()
+
 try:
-    full_info = safe_call(
-        "get_patient_info", password=password, patient_id=pid, parse_json=True
-    )
-    vitals = safe_call("get_vitals", password=password, patient_id=pid, parse_json=True)
-    meds = safe_call(
-        "get_medications", password=password, patient_id=pid, parse_json=True
-    )
-    hx = safe_call("get_history", password=password, patient_id=pid, parse_json=True)
+    full_info, vitals, meds, hx = _load_patient(pid, password)
 except RuntimeError as e:
     st.error(e)
     st.stop()
@@ -200,44 +411,15 @@ clean_info = sanitized_info(full_info)
 st.markdown("---")
 st.subheader("Ask the AI about this patient (name & DOB withheld)")
 question = st.text_input("Your question", placeholder="e.g. Any red flags?")
+ignore_cache = st.sidebar.checkbox("Ignore answer cache", value=False)
 if st.button("Ask") and question:
     ctx = build_ctx(question, info=clean_info, vitals=vitals, meds=meds, hx=hx)
-    messages = [
-        {
-            "role": "system",
-            "content": """You are a clinical assistant supporting a doctor during a consultation. Your role is to provide medically accurate, evidence-backed suggestions strictly based on the PATIENT_CONTEXT provided.
-
-            Your responsibilities include:
-
-            Interpreting the patient’s demographic data, vitals, medication, and medical history.
-
-            Identifying important clinical findings the doctor should consider.
-
-            Suggesting relevant follow-up questions the doctor might ask the patient to clarify symptoms or uncover hidden risk factors.
-
-            Recommending appropriate investigations or diagnostic tests, based on the current clinical picture.
-
-            Offering evidence-backed differential diagnoses, and helping the doctor rule in/out possibilities based on data.
-
-            Providing treatment options or next clinical steps, referencing current standards of care where applicable.
-
-            ⚠️ Important constraints:
-
-            Only use information contained in PATIENT_CONTEXT.
-
-            If the data is insufficient to draw conclusions, clearly state so.
-
-            Do not guess. Do not invent symptoms or conditions not explicitly supported by the data.
-
-            Present suggestions clearly and concisely, grouping them by category (e.g., questions to ask the patient, investigations, possible diagnoses, treatment options).
-
-            Always prioritize clinical safety and relevance.""",
-        },
-        {"role": "system", "content": f"PATIENT_CONTEXT = {json.dumps(ctx)}"},
-        {"role": "user", "content": question},
-    ]
-    with st.spinner("Thinking…"):
-        reply = client.chat.completions.create(
-            model="gpt-4o", messages=messages, temperature=0.6
-        )
-    st.success(reply.choices[0].message.content)
+    ctx_json = _json_dumps(ctx)
+    cache = _answer_cache()
+    key = (pid, ctx_json, question)
+    if ignore_cache:
+        cache.pop(key, None)
+    if key in cache:
+        st.markdown(cache[key])
+    else:
+        cache[key] = st.write_stream(_stream_answer(ctx_json, question))
@@ -5,8 +5,13 @@ DB_PATH = pathlib.Path("ehr.db")
 
 
 def seed():
-    conn = sqlite3.connect(DB_PATH)
+    # autocommit off (isolation_level=None) so we control the transaction:
+    # one BEGIN IMMEDIATE … COMMIT around all DDL + inserts means a single
+    # fsync no matter how many rows the seed grows to.
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
     c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
 
     # Demographics
     c.execute(
@@ -51,6 +56,18 @@ def seed():
     )"""
     )
 
+    # Covering indexes for the per-patient lookups (the ORDER BY … DESC
+    # LIMIT queries would otherwise scan + sort the whole table)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_vitals_pid_taken "
+        "ON vitals(patient_id, taken DESC)"
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_meds_pid ON meds(patient_id)")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_history_pid_recorded "
+        "ON history(patient_id, recorded DESC)"
+    )
+
     # ── five stub patients ───────────────────────────────
     patients = [
         ("P001", "Ada", "Obi", "F", "1986-03-14"),
@@ -59,7 +76,11 @@ def seed():
         ("P004", "Yusuf", "Bello", "M", "1965-01-30"),
         ("P005", "Tayo", "Ogunle", "M", "2002-06-09"),
     ]
-    c.executemany("INSERT OR IGNORE INTO patients VALUES (?,?,?,?,?)", patients)
+    c.executemany(
+        "INSERT OR REPLACE INTO patients (id,first_name,last_name,sex,dob) "
+        "VALUES (?,?,?,?,?)",
+        patients,
+    )
 
     # a couple of quick vitals, meds, history entries
     today = datetime.date.today().isoformat()
@@ -94,7 +115,7 @@ def seed():
         history,
     )
 
-    conn.commit()
+    c.execute("COMMIT")
     conn.close()
     print("EHR seeded → ehr.db")
 
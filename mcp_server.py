@@ -1,5 +1,5 @@
 # mcp_server.py
-import sqlite3, json
+import io, os, sqlite3, sys, json
 from contextlib import asynccontextmanager
 from collections.abc import AsyncIterator
 from mcp.server.fastmcp import FastMCP, Context
@@ -8,9 +8,27 @@ DB_PATH = "ehr.db"
 
 
 # ── lifespan keeps one DB connection open ───────────────────────────────
+def connect_db() -> sqlite3.Connection:
+    """Open the EHR database tuned for read-heavy access. Shared with the
+    in-process client mode in app.py so both paths get identical pragmas."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    # Read-heavy RPC server: WAL + relaxed sync keeps SELECTs off the
+    # fsync path, mmap/cache pragmas keep hot pages memory-resident.
+    conn.executescript(
+        "PRAGMA journal_mode=WAL;"
+        "PRAGMA synchronous=NORMAL;"
+        "PRAGMA temp_store=MEMORY;"
+        "PRAGMA mmap_size=268435456;"
+        "PRAGMA cache_size=-20000;"
+        "PRAGMA cache_spill=OFF;"
+    )
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
 @asynccontextmanager
 async def lifespan(server) -> AsyncIterator[sqlite3.Connection]:
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     try:
         yield conn
     finally:
@@ -20,67 +38,107 @@ async def lifespan(server) -> AsyncIterator[sqlite3.Connection]:
 mcp = FastMCP("EHR‑Gateway", lifespan=lifespan)
 
 
-# ── helpers ─────────────────────────────────────────────────────────────
-def row_to_dict(cursor, row):
-    return {d[0]: row[i] for i, d in enumerate(cursor.description)}
-
-
-def run_q(conn, q, params=()):
-    conn.row_factory = row_to_dict
-    cur = conn.execute(q, params)
-    return [dict(r) for r in cur.fetchall()]
+# Module-constant SQL: the per-connection statement cache keys on the
+# exact string object, so constants guarantee plan reuse across calls.
+# LIMITs are positional binds, never interpolated.
+Q_LIST = "SELECT id FROM patients"
+Q_INFO = "SELECT id, first_name, last_name, sex, dob FROM patients WHERE id=?"
+Q_VITALS = (
+    "SELECT taken, bp, hr, temp, weight_kg, blood_glucose_mmol_per_l FROM vitals "
+    "WHERE patient_id=? ORDER BY taken DESC LIMIT ?"
+)
+Q_MEDS = (
+    "SELECT drug, dose, start, IFNULL(stop,'ongoing') AS stop "
+    "FROM meds WHERE patient_id=?"
+)
+Q_HISTORY = (
+    "SELECT kind, details, recorded FROM history "
+    "WHERE patient_id=? ORDER BY recorded DESC LIMIT ?"
+)
+Q_BUNDLE = """
+SELECT json_object(
+  'info', (SELECT json_object('id', id, 'first_name', first_name,
+                              'last_name', last_name, 'sex', sex, 'dob', dob)
+           FROM patients WHERE id = :pid),
+  'vitals', (SELECT json_group_array(json_object(
+                'taken', taken, 'bp', bp, 'hr', hr, 'temp', temp,
+                'weight_kg', weight_kg,
+                'blood_glucose_mmol_per_l', blood_glucose_mmol_per_l))
+             FROM (SELECT * FROM vitals WHERE patient_id = :pid
+                   ORDER BY taken DESC LIMIT 3)),
+  'meds', (SELECT json_group_array(json_object(
+              'drug', drug, 'dose', dose, 'start', start,
+              'stop', IFNULL(stop, 'ongoing')))
+           FROM meds WHERE patient_id = :pid),
+  'history', (SELECT json_group_array(json_object(
+                 'kind', kind, 'details', details, 'recorded', recorded))
+              FROM (SELECT * FROM history WHERE patient_id = :pid
+                    ORDER BY recorded DESC LIMIT 5))
+)
+"""
 
 
 # ── tools ───────────────────────────────────────────────────────────────
+# row_factory is sqlite3.Row (set once in connect_db); one dict() per
+# row off its C-level mapping, no per-row description walk.
 @mcp.tool(description="List all patient IDs")
 def list_patients(ctx: Context) -> list[str]:
     conn = ctx.request_context.lifespan_context  # type: ignore
-    return [r["id"] for r in run_q(conn, "SELECT id FROM patients")]
+    return [r["id"] for r in conn.execute(Q_LIST)]
 
 
 @mcp.tool(description="Get core demographics")
 def get_patient_info(patient_id: str, ctx: Context) -> dict:
     conn = ctx.request_context.lifespan_context  # type: ignore
-    rows = run_q(
-        conn,
-        "SELECT id, first_name, last_name, sex, dob FROM patients WHERE id=?",
-        (patient_id,),
-    )
-    return rows[0] if rows else {}
+    row = conn.execute(Q_INFO, (patient_id,)).fetchone()
+    return dict(row) if row else {}
 
 
 @mcp.tool(description="Latest vitals (limit=3)")
 def get_vitals(patient_id: str, ctx: Context, limit: int = 3) -> list[dict]:
     conn = ctx.request_context.lifespan_context  # type: ignore
-    return run_q(
-        conn,
-        "SELECT taken, bp, hr, temp, weight_kg, blood_glucose_mmol_per_l FROM vitals "
-        "WHERE patient_id=? ORDER BY taken DESC LIMIT ?",
-        (patient_id, limit),
-    )
+    return [dict(r) for r in conn.execute(Q_VITALS, (patient_id, limit))]
 
 
 @mcp.tool(description="Active medications")
 def get_medications(patient_id: str, ctx: Context) -> list[dict]:
     conn = ctx.request_context.lifespan_context  # type: ignore
-    return run_q(
-        conn,
-        "SELECT drug, dose, start, IFNULL(stop,'ongoing') AS stop "
-        "FROM meds WHERE patient_id=?",
-        (patient_id,),
-    )
+    return [dict(r) for r in conn.execute(Q_MEDS, (patient_id,))]
 
 
 @mcp.tool(description="Problem / social / surgical history (limit=5)")
 def get_history(patient_id: str, ctx: Context, limit: int = 5) -> list[dict]:
     conn = ctx.request_context.lifespan_context  # type: ignore
-    return run_q(
-        conn,
-        "SELECT kind, details, recorded FROM history "
-        "WHERE patient_id=? ORDER BY recorded DESC LIMIT ?",
-        (patient_id, limit),
+    return [dict(r) for r in conn.execute(Q_HISTORY, (patient_id, limit))]
+
+
+@mcp.tool(description="Demographics, vitals, meds and history in one call")
+def get_patient_bundle(patient_id: str, ctx: Context) -> dict:
+    conn = ctx.request_context.lifespan_context  # type: ignore
+    row = conn.execute(Q_BUNDLE, {"pid": patient_id}).fetchone()
+    return json.loads(row[0])
+
+
+def _widen_stdio(buffer_size: int = 65536) -> None:
+    """Rewrap stdin/stdout with 64 KiB buffers. Default pipe buffering
+    (~4 KiB, plus CRLF translation on Windows) dominates stdio IPC cost;
+    the MCP transport still flushes at message boundaries."""
+    if sys.platform == "win32":
+        import msvcrt
+
+        msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
+        msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
+    sys.stdin = io.TextIOWrapper(
+        open(sys.stdin.fileno(), "rb", buffering=buffer_size, closefd=False),
+        encoding="utf-8",
+    )
+    sys.stdout = io.TextIOWrapper(
+        open(sys.stdout.fileno(), "wb", buffering=buffer_size, closefd=False),
+        encoding="utf-8",
+        line_buffering=False,
     )
 
 
 if __name__ == "__main__":
+    _widen_stdio()
     mcp.run(transport="stdio")